@@ -45,3 +45,95 @@ def test_generic_core_model():
     y = model(x)
 
     assert y.shape == (2, 16, 64)
+
+
+def test_generic_core_model_kv_cache():
+    """
+    Test that incremental decoding with a kv cache matches
+    the full forward pass.
+    """
+    model = build_core_model(
+        model_cfg={
+            "hidden_dim": 64,
+            "context_window": 64,
+            "vocab_size": 50257,
+            "positional_encoding_type": "rope",
+            "core_model": {
+                "core_model_type": "generic",
+                "norm_bias": True,
+                "ffn": {
+                    "ffn_type": "generic",
+                    "ffn_dim": 128,
+                    "activation": "relu",
+                    "normalization": "layer_norm",
+                    "bias": True,
+                },
+                "attn": {
+                    "attn_type": "generic",
+                    "num_heads": 8,
+                    "group_size": 8,
+                    "bias": True,
+                    "is_causal": True,
+                    "normalization": "rms_norm",
+                },
+                "num_layers": 2,
+            },
+        }
+    )
+    model.eval()
+
+    x = torch.randn(2, 8, 64)
+    with torch.no_grad():
+        y_full = model(x)
+
+        # prefill with the first 7 positions, then feed the last one
+        kv_cache = model.new_kv_cache()
+        model(x[:, :7], kv_cache=kv_cache)
+        y_step = model(x[:, 7:], kv_cache=kv_cache)
+
+    assert torch.allclose(y_full[:, 7:], y_step, atol=1e-5)
+
+
+def test_generic_core_model_padding_mask():
+    """
+    With right padding, the masked outputs at the real positions must
+    match running the unpadded sequence on its own.
+    """
+    model_cfg = {
+        "hidden_dim": 64,
+        "context_window": 64,
+        "positional_encoding_type": "rope",
+        "core_model": {
+            "core_model_type": "generic",
+            "num_layers": 2,
+            "ffn": {
+                "ffn_type": "generic",
+                "ffn_dim": 128,
+                "activation": "gelu",
+                "normalization": "rms_norm",
+                "bias": False,
+            },
+            "attn": {
+                "attn_type": "generic",
+                "num_heads": 8,
+                "normalization": "rms_norm",
+                "group_size": 4,
+                "bias": False,
+                "is_causal": True,
+            },
+        },
+    }
+    core_model = build_core_model(model_cfg)
+    core_model.eval()
+
+    torch.manual_seed(0)
+    x = torch.randn(2, 12, 64)
+    real_len = 9
+    mask = torch.zeros(2, 12, dtype=torch.bool)
+    mask[:, :real_len] = True
+
+    with torch.no_grad():
+        y_masked = core_model(x, attention_mask=mask)
+        y_unpadded = core_model(x[:, :real_len])
+
+    assert torch.allclose(y_masked[:, :real_len], y_unpadded, atol=1e-5)
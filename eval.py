@@ -24,6 +24,13 @@ def main(cfg):
         model = build_model(model_cfg=cfg["model"])
     model.eval()
 
+    # optionally quantize the core model's linear layers to int8 for
+    # faster CPU eval; the embedder and lm head stay in full precision
+    if cfg["testing"].get("quantize", False):
+        model.core_model = torch.ao.quantization.quantize_dynamic(
+            model.core_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
     # load the evaluator
     benchmark_names = cfg["testing"]["benchmarks"]
     benchmark_names = [str(benchmark_name) for benchmark_name in benchmark_names]
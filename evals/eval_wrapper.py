@@ -1,5 +1,7 @@
 """Integration code"""
 
+from collections.abc import Iterator
+
 import torch
 
 from models import embedding_models, generator, model_shell
@@ -12,38 +14,59 @@ def batch(data, batch_size):
 
 class EvalWrapper:
     def __init__(self, model_shell: model_shell.ModelShell):
-        self.model_shell = model_shell
+        # move the model to the device once here, rather than
+        # re-walking every parameter on each loglikelihood call
+        self.device_str = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(self.device_str)
+        self.model_shell = model_shell.to(self.device)
+        self.model_generator = None
         super().__init__()
 
     def loglikelihood(self, prefixes, continuations) -> list[float]:
         """
         Compute the loglikelihood of given inputs
         """
-        device_str = "cuda" if torch.cuda.is_available() else "cpu"
-        device = torch.device(device_str)
-        self.model_shell = self.model_shell.to(device)
-        results = []
-        with torch.no_grad():
-            with torch.autocast(device_type=device_str):
-                for prefix_batch, cont_batch in zip(
-                    batch(prefixes, 32), batch(continuations, 32)
-                ):
-                    ll = self.model_shell.loglikelihood(prefix_batch, cont_batch)
-                    results.extend(ll.cpu().numpy())
+        # tokenize the entire request set up front in one batched
+        # tokenizer call, so the forward passes below can be enqueued
+        # back-to-back without the GPU waiting on the tokenizer
+        input_tokens = self.model_shell.tokenize_loglikelihood_inputs(
+            prefixes, continuations
+        )
+        # sort the requests by token length so each batch contains
+        # similarly-sized sequences and is padded to a much
+        # smaller max length; results are scattered back into
+        # the original order afterwards
+        order = sorted(range(len(input_tokens)), key=lambda i: len(input_tokens[i]))
+        results = [None] * len(prefixes)
+        ll_batches = []
+        with torch.inference_mode():
+            with torch.autocast(device_type=self.device_str):
+                for index_batch in batch(order, 32):
+                    # keep the per-batch results on device; a single
+                    # transfer at the end avoids a host sync per batch
+                    ll_batches.append(
+                        self.model_shell.loglikelihood_tokens(
+                            [input_tokens[i] for i in index_batch]
+                        )
+                    )
+        for i, ll_value in zip(order, torch.cat(ll_batches).float().cpu().tolist()):
+            results[i] = ll_value
         return results
 
-    def generate(self, prefixes) -> list[str]:
+    def generate(self, prefixes) -> Iterator[str]:
         """
         Generate a continuation for a given prefix
         """
-        model_generator = generator.StandardGenerator(
-            self.model_shell,
-            generate_cfg={
-                "max_new_tokens": 128,
-                "temperature": 0.7,
-                "top_k": 0.9,
-            },
-        )
+        # build the generator wrapper once and reuse it across calls
+        if self.model_generator is None:
+            self.model_generator = generator.StandardGenerator(
+                self.model_shell,
+                generate_cfg={
+                    "max_new_tokens": 128,
+                    "temperature": 0.7,
+                    "top_k": 0.9,
+                },
+            )
         for prefix in prefixes:
             # tokenize the inputs
-            yield model_generator.default_generate(prefix)
+            yield self.model_generator.default_generate(prefix)
@@ -52,14 +52,32 @@ class MCQEvaluator(EvaluationInterface):
         """Evaluate model performance on a specific benchmark"""
         # load the benchmark_loader
         benchmark_loader = load_benchmark(benchmark_name, split="test")
-        confidences = []
+        # collect every question's options into one request list so the
+        # model sees large homogeneous batches instead of one small
+        # forward pass per question
+        prefixes, continuations, option_counts = [], [], []
         for i, (prefix, ground_truth, false_options) in tqdm.tqdm(
             enumerate(benchmark_loader)
         ):
             if num_samples is not None and i > num_samples:
                 break
-            loglikelihoods = self.predict(prefix, ground_truth, false_options)
-            confidences.append(loglikelihoods)
+            options = [ground_truth] + false_options
+            prefixes.extend([prefix] * len(options))
+            continuations.extend(options)
+            option_counts.append(len(options))
+
+        loglikelihoods = self.wrapper.loglikelihood(
+            prefixes=prefixes, continuations=continuations
+        )
+
+        # split the flat result list back into one tensor per question
+        confidences = []
+        offset = 0
+        for option_count in option_counts:
+            confidences.append(
+                torch.tensor(loglikelihoods[offset : offset + option_count])
+            )
+            offset += option_count
         # find the maximum dimension and pad the confidences up to that dimension
         max_length = max([len(confidence) for confidence in confidences])
         for i, confidence in enumerate(confidences):
@@ -3,17 +3,7 @@ Contains the build functions for the embedder,
 core model, lm head and the model shell.
 """
 
-from models.core_models import GenericFFNSharedTransfomer, GenericTransformer
-from models.embedding_models import GenericEmbedder
-from models.experimental.byte_level.embedding_model import ByteLevelEmbedder
-from models.experimental.byte_level.model_heads import ByteLevelDecoder
-from models.experimental.byte_level.byte_model_shell import ByteModelShell
-from models.experimental.hugging_face import HFEmbedder, HFLMHead, HFTransformerCore
-from models.experimental.next_thought.embedding_models import HierarchicalEncoder
-from models.experimental.next_thought.model_heads import VariableLengthLatentDecoder
-from models.experimental.next_thought.core_models import BaselineCoreModel, Conv1dCoreModel
-from models.model_heads import AutoregressiveLMHead
-from models.model_shell import ModelShell
+import importlib
 
 
 def build_model(model_cfg=None, checkpoint=None):
@@ -32,7 +22,8 @@ def build_model(model_cfg=None, checkpoint=None):
     # check if model is to be loaded
     if checkpoint is not None:
         # load model with the correct architecture
-        model = initialize_model(checkpoint["config"]["model"])
+        model_cfg = checkpoint["config"]["model"]
+        model = initialize_model(model_cfg)
 
         # load the model weights
         model.load_state_dict(checkpoint["model"])
@@ -41,15 +32,31 @@ def build_model(model_cfg=None, checkpoint=None):
         # initialize model
         model = initialize_model(model_cfg)
 
+    # optionally compile the model; the fixed-topology transformer stacks
+    # are ideal for inductor's kernel fusion. The in-place Module.compile
+    # keeps the state_dict keys unprefixed so checkpoints stay compatible.
+    if model_cfg.get("compile", False):
+        model.compile()
+
     return model
 
 
+# the component registries map names to (module, class name) pairs and
+# are resolved lazily, so importing this module (and building e.g. a
+# generic model) doesn't pull in the heavy experimental dependencies
+# (HF transformers etc.) of architectures that aren't being used
 EMBEDDING_MODEL_DICT = {
-    "generic": GenericEmbedder, 
-    "byte_level": ByteLevelEmbedder,
-    "hf_embedder": HFEmbedder,
-    "hierarchical": HierarchicalEncoder,
-    }
+    "generic": ("models.embedding_models", "GenericEmbedder"),
+    "byte_level": ("models.experimental.byte_level.embedding_model", "ByteLevelEmbedder"),
+    "hf_embedder": ("models.experimental.hugging_face", "HFEmbedder"),
+    "hierarchical": ("models.experimental.next_thought.embedding_models", "HierarchicalEncoder"),
+}
+
+
+def _load_class(registry, key):
+    """Resolve a (module, class name) registry entry via importlib."""
+    module_name, class_name = registry[key]
+    return getattr(importlib.import_module(module_name), class_name)
 
 
 def build_embedding_model(model_cfg):
@@ -60,17 +67,18 @@ def build_embedding_model(model_cfg):
     Returns:
         embedding_model: embedding_model_instance
     """
-    return EMBEDDING_MODEL_DICT[model_cfg["embedder"]["embedding_model_type"]](
-        model_cfg=model_cfg
+    embedder_cls = _load_class(
+        EMBEDDING_MODEL_DICT, model_cfg["embedder"]["embedding_model_type"]
     )
+    return embedder_cls(model_cfg=model_cfg)
 
 
 CORE_MODEL_DICT = {
-    "generic": GenericTransformer,
-    "generic_ffn_sharing": GenericFFNSharedTransfomer,
-    "hf_core": HFTransformerCore,
-    "next_thought_baseline": BaselineCoreModel,
-    "conv": Conv1dCoreModel
+    "generic": ("models.core_models", "GenericTransformer"),
+    "generic_ffn_sharing": ("models.core_models", "GenericFFNSharedTransfomer"),
+    "hf_core": ("models.experimental.hugging_face", "HFTransformerCore"),
+    "next_thought_baseline": ("models.experimental.next_thought.core_models", "BaselineCoreModel"),
+    "conv": ("models.experimental.next_thought.core_models", "Conv1dCoreModel"),
 }
 
 
@@ -82,20 +90,21 @@ def build_core_model(model_cfg):
     Returns:
         core_model: core_model_instance
     """
-    return CORE_MODEL_DICT[model_cfg["core_model"]["core_model_type"]](
-        model_cfg=model_cfg
+    core_model_cls = _load_class(
+        CORE_MODEL_DICT, model_cfg["core_model"]["core_model_type"]
     )
+    return core_model_cls(model_cfg=model_cfg)
 
 
 MODEL_HEAD_DICT = {
-    "generic": lambda model_cfg, embedding_model: AutoregressiveLMHead(model_cfg=model_cfg), 
-    "byte_level": lambda model_cfg, embedding_model: ByteLevelDecoder(model_cfg=model_cfg), 
-    "hf_head": lambda model_cfg, embedding_model: HFLMHead(model_cfg=model_cfg),
-    "latent_2_seq": lambda model_cfg, embedding_model: VariableLengthLatentDecoder(
-        model_cfg=model_cfg,
-        embedding_model=embedding_model
-    ), 
-    }
+    "generic": ("models.model_heads", "AutoregressiveLMHead"),
+    "byte_level": ("models.experimental.byte_level.model_heads", "ByteLevelDecoder"),
+    "hf_head": ("models.experimental.hugging_face", "HFLMHead"),
+    "latent_2_seq": ("models.experimental.next_thought.model_heads", "VariableLengthLatentDecoder"),
+}
+
+# heads that additionally consume the embedding model at build time
+_MODEL_HEADS_WITH_EMBEDDER = {"latent_2_seq"}
 
 
 def build_model_head(model_cfg, embedding_model=None):
@@ -106,15 +115,16 @@ def build_model_head(model_cfg, embedding_model=None):
     Returns:
         model_head: model_head_instance
     """
-    return MODEL_HEAD_DICT[model_cfg["lm_head"]["lm_head_type"]](
-        model_cfg=model_cfg, 
-        embedding_model=embedding_model
-    )
+    lm_head_type = model_cfg["lm_head"]["lm_head_type"]
+    model_head_cls = _load_class(MODEL_HEAD_DICT, lm_head_type)
+    if lm_head_type in _MODEL_HEADS_WITH_EMBEDDER:
+        return model_head_cls(model_cfg=model_cfg, embedding_model=embedding_model)
+    return model_head_cls(model_cfg=model_cfg)
 
 
 MODEL_SHELL_DICT = {
-    "standard": ModelShell,
-    "byte_shell": ByteModelShell
+    "standard": ("models.model_shell", "ModelShell"),
+    "byte_shell": ("models.experimental.byte_level.byte_model_shell", "ByteModelShell"),
 }
 
 
@@ -126,7 +136,8 @@ def build_model_shell(model_cfg, embedding_model, core_model, model_head):
     Returns:
         model_shell: model_shell_instance
     """
-    return MODEL_SHELL_DICT[model_cfg["model_shell_type"]](
+    model_shell_cls = _load_class(MODEL_SHELL_DICT, model_cfg["model_shell_type"])
+    return model_shell_cls(
         embedding_model=embedding_model, core_model=core_model, model_head=model_head
     )
 
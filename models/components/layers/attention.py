@@ -46,15 +46,29 @@ class Attention(torch.nn.Module):
                 seq_len=context_window, head_dim=hidden_dim // num_heads
             )
 
-    def forward(self, x, attention_mask=None):
+    def forward(self, x, attention_mask=None, kv_cache=None):
         """
         Forward pass
+
+        When `kv_cache` (a dict) is given, the keys/values of previous
+        positions are read from it and the new positions are appended,
+        so incremental decoding only computes attention for the new
+        tokens instead of re-attending over the full prefix.
+
+        `attention_mask` is an optional (B, S) boolean keep-mask marking
+        the real (non-pad) positions.
         """
-        assert attention_mask is None, "Not implemented yet"
+        assert attention_mask is None or kv_cache is None, (
+            "attention masking is not supported together with a kv cache"
+        )
         B, S, H = x.size()
         num_grouped_heads = self.num_heads // self.group_size
         group_hidden_dim = H // self.group_size
 
+        # number of already-cached positions (0 on the prefill pass)
+        past_length = kv_cache["k"].size(2) if kv_cache else 0
+        assert not (past_length and S > 1), "cached decoding appends one token at a time"
+
         # calculate query, key, values for all heads in batch
         # move head forward to be the batch dim
         q, k, v = self.c_attn(x).split([H, group_hidden_dim, group_hidden_dim], dim=-1)
@@ -65,24 +79,52 @@ class Attention(torch.nn.Module):
         )  # (B, nh, T, hs)
 
         if self.use_rope:
-            q, k = apply_rotary_emb(q, k, freqs_cis=self.freqs_cis[:S].to(x.device))
+            q, k = apply_rotary_emb(
+                q,
+                k,
+                freqs_cis=self.freqs_cis[past_length : past_length + S].to(x.device),
+            )
         q = q.transpose(1, 2)  # (B, nh,  d, hs)
         k = k.transpose(1, 2)  # (B, nh, T, hs)
 
+        # append the new keys/values to the cache (stored pre-grouping)
+        if kv_cache is not None:
+            if past_length:
+                k = torch.cat((kv_cache["k"], k), dim=2)
+                v = torch.cat((kv_cache["v"], v), dim=2)
+            kv_cache["k"] = k
+            kv_cache["v"] = v
+
         # reshape to have same dim as q
         k = k.repeat_interleave(self.group_size, dim=1)
         v = v.repeat_interleave(self.group_size, dim=1)
 
+        # combine the padding keep-mask with causality into one boolean
+        # SDPA mask; the diagonal is kept enabled so fully padded query
+        # rows still attend to themselves instead of producing NaNs
+        attn_mask = None
+        is_causal = self.is_causal and not past_length
+        if attention_mask is not None:
+            attn_mask = attention_mask[:, None, None, :].to(torch.bool)
+            if self.is_causal:
+                attn_mask = attn_mask & torch.ones(
+                    S, S, dtype=torch.bool, device=x.device
+                ).tril()
+            attn_mask = attn_mask | torch.eye(S, dtype=torch.bool, device=x.device)
+            is_causal = False
+
         # causal self-attention; Self-attend: (B, nh, T, hs) x (B, nh, hs, T) -> (B, nh, T, T)
         # flash attention
+        # a single-token query attends to the whole cache, so the causal
+        # mask (which is aligned top-left) must be dropped for it
         # pylint: disable=not-callable
         y = torch.nn.functional.scaled_dot_product_attention(
             query=q,
             key=k,
             value=v,
-            attn_mask=None,
+            attn_mask=attn_mask,
             dropout_p=self.attn_dropout.p if self.training else 0,
-            is_causal=self.is_causal,
+            is_causal=is_causal,
         )
         # pylint: enable=not-callable
         y = (
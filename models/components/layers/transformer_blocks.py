@@ -47,16 +47,18 @@ class GenericTransformerBlock(torch.nn.Module):
             ffn_cfg=ffn_cfg,
         )
 
-    def forward(self, x, attention_mask=None):
+    def forward(self, x, attention_mask=None, kv_cache=None):
         """
         A simple, residual forward
         pass through the GPT block.
         Args:
             x: the input tensor (b, s, h)
             attention_mask: the attention mask
+            kv_cache: optional per-layer kv cache dict for
+                incremental decoding
         Returns:
             x: the output tensor (b, s, h)
         """
-        x = x + self.attn(self.attn_norm(x), attention_mask)
+        x = x + self.attn(self.attn_norm(x), attention_mask, kv_cache=kv_cache)
         x = x + self.ffn(self.ffn_norm(x))
         return x
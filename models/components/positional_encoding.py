@@ -17,18 +17,23 @@ class LearnedPosEncoding(torch.nn.Module):
             num_embeddings=context_window, embedding_dim=hidden_dim
         )
 
-    def forward(self, x):
+    def forward(self, x, offset=0):
         """
         Takes the input tensor and returns it positionally encoded.
         Args:
             x: torch.tensor(B, S, H)
+            offset: index of the first position, for incremental decoding
         Returns:
             x: torch.tensor(B, S, H)
         """
+        # the rows offset..offset+S-1 of the embedding table are exactly
+        # the encodings for those positions, so slice the weight directly
+        # instead of launching an embedding gather; gradients still
+        # flow to self.pe.weight
         if len(x.shape) >= 2:
-            return x + (self.pe(torch.arange(x.size(1), device=x.device)).unsqueeze(0))
+            return x + self.pe.weight[offset : offset + x.size(1)].unsqueeze(0)
         else:
-            return x + self.pe(torch.arange(x.size(1), device=x.device))
+            return x + self.pe.weight[offset : offset + x.size(0)]
 
 
 class IdentityEncoding(torch.nn.Module):
@@ -39,7 +44,7 @@ class IdentityEncoding(torch.nn.Module):
     def __init__(self):
         super().__init__()
 
-    def forward(self, x):
+    def forward(self, x, offset=0):
         """
         Returns the input tensor as is.
         """
@@ -65,10 +70,10 @@ class SinCosPosEncoding(
         self.pe = torch.nn.Parameter(pe) # hack for distributed data parallel
         self.pe.requires_grad = False
 
-    def forward(self, x):
+    def forward(self, x, offset=0):
         """Add the pe to the input tensor."""
         # x of shape (B, S, H)
-        return x + self.pe[:, :x.size(1)]
+        return x + self.pe[:, offset : offset + x.size(1)]
 
 
 POS_ENCODING_DICT = {
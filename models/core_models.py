@@ -16,12 +16,14 @@ class GenericTransformer(torch.nn.Module):
     def __init__(self, model_cfg):
         super().__init__()
 
-        # build the transformer
+        # build the transformer; the blocks live in an nn.Sequential so
+        # the whole stack is a single traceable call for torch.compile
+        # (checkpoint keys are identical to the previous ModuleList)
         self.transformer = torch.nn.ModuleDict(
             {
                 "drop": torch.nn.Dropout(),
-                "h": torch.nn.ModuleList(
-                    [
+                "h": torch.nn.Sequential(
+                    *[
                         GenericTransformerBlock(
                             hidden_dim=model_cfg["hidden_dim"],
                             context_window=model_cfg["context_window"],
@@ -35,11 +37,15 @@ class GenericTransformer(torch.nn.Module):
             }
         )
 
-    def forward(self, x):
+    def forward(self, x, attention_mask=None, kv_cache=None):
         """
         Pass an input through the model
         Args:
             x: torch.tensor(B, S, H)
+            attention_mask: optional (B, S) boolean keep-mask
+                marking the real (non-pad) positions
+            kv_cache: optional list of per-layer cache dicts,
+                as returned by `new_kv_cache`
         Returns:
             x: torch.tensor(B, S, H)
         """
@@ -47,12 +53,25 @@ class GenericTransformer(torch.nn.Module):
         # apply dropout
         x = self.transformer.drop(x)
 
-        # pass through the transformer blocks
-        for block in self.transformer.h:
-            x = block(x)
+        if attention_mask is None and kv_cache is None:
+            # pass through the transformer blocks
+            return self.transformer.h(x)
 
+        if kv_cache is None:
+            kv_cache = [None] * len(self.transformer.h)
+
+        # thread the mask / per-layer caches through explicitly
+        for block, layer_cache in zip(self.transformer.h, kv_cache):
+            x = block(x, attention_mask=attention_mask, kv_cache=layer_cache)
         return x
 
+    def new_kv_cache(self):
+        """
+        Build an empty kv cache (one dict per transformer block)
+        for incremental decoding.
+        """
+        return [{} for _ in self.transformer.h]
+
 
 class GenericFFNSharedTransfomer(GenericTransformer):
     """
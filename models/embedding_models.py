@@ -36,6 +36,24 @@ class EmbedderInterface(torch.nn.Module):
         """
         raise NotImplementedError
 
+    def tokenize_input_batch(self, input_strings, truncate=False, add_eot=True):
+        """Tokenize a batch of input strings.
+
+        The default implementation loops over `tokenize_input`;
+        embedders with a batched tokenizer should override this
+        to amortize the per-call overhead.
+        Args:
+            input_strings: list[str]
+            truncate: bool - whether to perform (left) truncation
+            add_eot: bool
+        Returns:
+            list of token_id lists
+        """
+        return [
+            self.tokenize_input(input_string, truncate=truncate, add_eot=add_eot)
+            for input_string in input_strings
+        ]
+
     def decode(self, tokens: torch.LongTensor):
         """This function should decode a tensor of tokens into a string.
 
@@ -115,7 +133,7 @@ class GenericEmbedder(EmbedderInterface):
         self.eot_token = self.tokenizer.eot_token
         self.model_cfg = model_cfg
 
-    def forward(self, token_ids):
+    def forward(self, token_ids, pos_offset=0):
         """
         Takes the token_ids as input
         and returns the embeddings.
@@ -123,6 +141,8 @@ class GenericEmbedder(EmbedderInterface):
         To obtain the token ids, use `.tokenize_input()`
         Args:
             token_ids: torch.tensor(B, S)
+            pos_offset: position of the first token, used when
+                decoding incrementally with a kv cache
         Returns:
             embeddings: torch.tensor(B, S, H)
         """
@@ -131,7 +151,7 @@ class GenericEmbedder(EmbedderInterface):
         x = self.token_embedder(token_ids)
 
         # apply the positional encoding, if any
-        x = self.positional_encodings(x)
+        x = self.positional_encodings(x, offset=pos_offset)
 
         return x
 
@@ -146,6 +166,19 @@ class GenericEmbedder(EmbedderInterface):
             token_ids = self.truncate([token_ids])[0]
         return token_ids
 
+    def tokenize_input_batch(self, input_strings, truncate=False, add_eot=True):
+        """
+        Tokenize a batch of input strings in a single
+        tokenizer call to amortize the per-string overhead.
+        """
+        token_id_lists = list(self.tokenizer.encode_batch(input_strings))
+        if add_eot:
+            for token_ids in token_id_lists:
+                token_ids.append(self.eot_token)
+        if truncate:
+            token_id_lists = self.truncate(token_id_lists)
+        return token_id_lists
+
     def pad_batch(self, token_lists, direction="right"):
         """Pad a list of token lists to the same length,
         and return the padded tensor, and mask tensor.
@@ -34,9 +34,10 @@ class ByteLevelDecoder(torch.nn.Module):
             hidden_dim=self.embedding_dim, context_window=self.byte_context_window
         )
 
-        # build transformer block
-        self.transformer = torch.nn.ModuleList(
-            [
+        # build transformer block (a Sequential keeps the block stack
+        # a single traceable call for the compiler)
+        self.transformer = torch.nn.Sequential(
+            *[
                 ByteLevelTransformerBlock(
                     input_dim=self.embedding_dim,
                     output_dim=self.embedding_dim,
@@ -100,20 +101,24 @@ class ByteLevelDecoder(torch.nn.Module):
         Bidirectionally decode all tokens at once
         """
 
-        # project the latent embeddings
-        x = self.projection(x)
-        x = x.view(x.size(0), x.size(1), self.byte_context_window, self.embedding_dim)
-
-        # pass through model and deocde
-        B, S, _, _ = x.size()
-        x = x.view(B * S, self.byte_context_window, self.embedding_dim)
+        # project the latent embeddings; the projection weight is viewed
+        # as byte_context_window independent (embedding_dim, hidden_dim)
+        # heads so the einsum lands directly in the (B * S,
+        # byte_context_window, embedding_dim) layout the byte
+        # transformer consumes, with no intermediate reshape
+        B, S = x.size(0), x.size(1)
+        proj_weight = self.projection.weight.view(
+            self.byte_context_window, self.embedding_dim, self.hidden_dim
+        )
+        x = torch.einsum("bsh,weh->bswe", x, proj_weight).reshape(
+            B * S, self.byte_context_window, self.embedding_dim
+        )
 
         # positional encoding
         x = x + self.pos_encoder(x)
 
         # pass through transformer
-        for block in self.transformer:
-            x = block(x)
+        x = self.transformer(x)
 
         # pass final self.byte_context_window byte tokens through lm head
         x = self.lm_head(x)
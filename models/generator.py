@@ -11,8 +11,9 @@ class StandardGenerator(torch.nn.Module):
     def __init__(self, model, generate_cfg):
         """Initialize the model and the configuration"""
         super().__init__()
-        self.model = model
-        self.model = self.model.to(torch.device("cuda"))
+        # move the model once here; generate() reuses the same device
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = model.to(self.device)
         self.generate_config = generate_cfg
 
     def default_generate(self, input_text):
@@ -36,8 +37,15 @@ class StandardGenerator(torch.nn.Module):
         idx = self.model.embedding_model.tokenize_input(input_string=input_text,
                                                         add_eot=False,
                                                         truncate=True)
-        # push to device
-        idx = torch.tensor(idx).unsqueeze(0).to(torch.device("cuda"))
+        # build the tensor directly on the target device rather than
+        # constructing it on the CPU and copying it over afterwards
+        idx = torch.tensor(idx, device=self.device).unsqueeze(0)
+
+        # decode incrementally with a kv cache where the model supports
+        # it - each step then only computes attention for the new token
+        if hasattr(self.model, "supports_kv_cache") and self.model.supports_kv_cache():
+            return self._generate_kv_cached(idx, max_new_tokens, temperature, top_k)
+
         for _ in range(max_new_tokens):
             # forward the model to get the logits for the index in the sequence
             logits = self.model.inference(idx)
@@ -79,6 +87,41 @@ class StandardGenerator(torch.nn.Module):
 
         return self.model.embedding_model.decode(idx.tolist())
 
+    @torch.no_grad()
+    def _generate_kv_cached(self, idx, max_new_tokens, temperature=1.0, top_k=None):
+        """
+        Incremental decoding loop. The prompt is prefilled into the kv
+        cache once; every generated token is then fed back on its own,
+        costing O(1) attention work per step instead of re-running the
+        model over the whole growing sequence.
+        """
+        context_window = self.model.embedding_model.model_cfg["context_window"]
+        kv_cache = self.model.core_model.new_kv_cache()
+
+        # prefill the cache with the full prompt
+        logits = self.model.inference_step(idx, kv_cache)
+        for _ in range(max_new_tokens):
+            # scale by desired temperature
+            logits = logits / temperature
+            # optionally crop the logits to only the top k options
+            if top_k is not None:
+                v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
+                logits[logits < v[:, [-1]]] = -float("Inf")
+            # apply softmax to convert logits to (normalized) probabilities
+            probs = torch.nn.functional.softmax(logits, dim=-1)
+            idx_next = torch.multinomial(probs, num_samples=1)
+            if idx_next == self.model.embedding_model.eot_token:
+                break
+            idx = torch.cat((idx, idx_next), dim=1)
+            if idx.size(1) >= context_window:
+                break
+            # feed only the new token; its position is the sequence end
+            logits = self.model.inference_step(
+                idx_next, kv_cache, pos_offset=idx.size(1) - 1
+            )
+
+        return self.model.embedding_model.decode(idx.tolist())
+
     def forward(self, x):
         """Call the underlying model"""
         return self.model(x)
@@ -38,10 +38,11 @@ class ModelShell(torch.nn.Module):
         self.device = args[0]
         return super().to(*args, **kwargs)
 
-    def forward(self, token_ids):
+    def forward(self, token_ids, attention_mask=None):
         """
         The default forward pass is used for trianing and
-        accepts the token_ids as input.
+        accepts the token_ids as input. An optional (B, S) boolean
+        attention_mask marks the real (non-pad) positions.
         """
 
         # pass the token_ids through the embedding model
@@ -49,7 +50,10 @@ class ModelShell(torch.nn.Module):
         x = self.embedding_model(token_ids)
 
         # pass the embeddings through the core model
-        x = self.core_model(x)
+        if attention_mask is not None:
+            x = self.core_model(x, attention_mask=attention_mask)
+        else:
+            x = self.core_model(x)
 
         # pass the core model output through the model head
         x = self.model_head(x)
@@ -83,6 +87,66 @@ class ModelShell(torch.nn.Module):
 
         return logits, model_input
 
+    def tokenize_loglikelihood_inputs(self, prefixes, continuations):
+        """
+        Tokenize prefix/continuation pairs for `loglikelihood_tokens`.
+        Args:
+            prefixes: list[str]
+            continuations: list[str]
+        Returns:
+            input_tokens: list of token id lists
+        """
+        # tokenize each unique prefix only once - few-shot/MCQ batches
+        # repeat the same (long) context once per continuation
+        unique_prefixes = list(dict.fromkeys(prefixes))
+        prefix_tokens = dict(
+            zip(
+                unique_prefixes,
+                self.embedding_model.tokenize_input_batch(
+                    unique_prefixes, add_eot=False
+                ),
+            )
+        )
+        # the separating space is kept with the continuation so the
+        # spliced token lists match the joint tokenization at the boundary
+        cont_tokens = self.embedding_model.tokenize_input_batch(
+            [f" {cont}" for cont in continuations]
+        )
+        return self.embedding_model.truncate(
+            [
+                prefix_tokens[prefix] + cont
+                for prefix, cont in zip(prefixes, cont_tokens)
+            ]
+        )
+
+    def supports_kv_cache(self):
+        """
+        Whether the shell can decode incrementally with a kv cache.
+        Only the generic embedder/core combination threads the cache
+        and position offsets through.
+        """
+        return isinstance(
+            self.embedding_model, embedding_models.GenericEmbedder
+        ) and isinstance(self.core_model, core_models.GenericTransformer)
+
+    @torch.no_grad()
+    def inference_step(self, token_ids, kv_cache, pos_offset=0):
+        """
+        Run a single incremental decoding step. On the first call pass
+        the full prompt (the prefill); on subsequent calls pass only the
+        newly generated token together with its position offset.
+        Args:
+            token_ids: torch.tensor(B, S)
+            kv_cache: list of per-layer cache dicts from
+                `core_model.new_kv_cache()`, updated in place
+            pos_offset: position of the first token in `token_ids`
+        Returns:
+            logits: torch.tensor(B, V) for the final position
+        """
+        x = self.embedding_model(token_ids, pos_offset=pos_offset)
+        x = self.core_model(x, kv_cache=kv_cache)
+        return self.model_head.inference(x)
+
     @torch.no_grad()
     def loglikelihood(self, prefixes, continuations):
         """
@@ -94,15 +158,44 @@ class ModelShell(torch.nn.Module):
         Returns:
             ll: torch.tensor(B)
         """
-        total_strings = [f"{prefix} {cont}" for prefix, cont in zip(prefixes, continuations)]
-        input_tokens = [self.embedding_model.tokenize_input(string, truncate=True) for string in total_strings]
+        input_tokens = self.tokenize_loglikelihood_inputs(prefixes, continuations)
+        return self.loglikelihood_tokens(input_tokens)
+
+    @torch.no_grad()
+    def loglikelihood_tokens(self, input_tokens):
+        """
+        Compute the loglikelihood of pre-tokenized inputs, so callers
+        can tokenize ahead of the GPU work.
+        Args:
+            input_tokens: list of token id lists
+        Returns:
+            ll: torch.tensor(B)
+        """
         padded_batch, mask = self.embedding_model.pad_batch(input_tokens, direction="right")
         input_tensor = torch.tensor(padded_batch, device=self.device, dtype=torch.long)
-        logits, _ = self.forward(input_tensor)
-        logits = logits[:, :-1].reshape(-1, logits.size(-1))
-        target_tensor = input_tensor[:, 1:].reshape(-1)
-        ll = torch.nn.functional.cross_entropy(logits, target_tensor, reduction="none")
-        mask = mask[:, 1:].reshape(-1).to(ll.device)
-        ll = ll * mask
-        ll = ll.view(input_tensor.size(0), -1).sum(dim=1)
+        # mask out the pad positions so attention spends no work on them
+        # (only the generic core threads the mask through)
+        if isinstance(self.core_model, core_models.GenericTransformer):
+            attention_mask = mask.to(input_tensor.device).bool()
+            logits, _ = self.forward(input_tensor, attention_mask=attention_mask)
+        else:
+            logits, _ = self.forward(input_tensor)
+        # pack the loss computation down to the real (non-pad) positions
+        # so no cross-entropy work is spent on padding
+        batch_size, seq_len = input_tensor.size(0), input_tensor.size(1)
+        mask = mask[:, 1:].reshape(-1).to(logits.device).bool()
+        logits = logits[:, :-1].reshape(-1, logits.size(-1))[mask]
+        target_tensor = input_tensor[:, 1:].reshape(-1)[mask]
+        losses = torch.nn.functional.cross_entropy(
+            logits, target_tensor, reduction="none"
+        )
+        # sum the per-position losses back into their rows
+        row_ids = (
+            torch.arange(batch_size, device=losses.device)
+            .unsqueeze(1)
+            .expand(batch_size, seq_len - 1)
+            .reshape(-1)[mask]
+        )
+        ll = torch.zeros(batch_size, device=losses.device, dtype=losses.dtype)
+        ll = ll.index_add(0, row_ids, losses)
         return -ll
\ No newline at end of file
@@ -54,6 +54,13 @@ class BaseTrainer:
         self.lr_scheduler = lr_scheduler
         self.dropout_scheduler = dropout_scheduler
         self.train_dataloader_iter = iter(train_dataloader)
+        if torch.cuda.is_available():
+            # prefetch training batches to the GPU on a side stream so
+            # the H2D copy overlaps with the previous step's compute
+            self.train_dataloader_iter = utils.CUDAPrefetcher(
+                self.train_dataloader_iter,
+                gpu_id if gpu_id is not None else next(model.parameters()).device,
+            )
         self.val_dataloader = val_dataloader
         self.loss_fn = loss_fn
         self.cfg = cfg
@@ -124,8 +131,10 @@ class BaseTrainer:
         losses = []
         perplexities = []
         for i, (x, y) in enumerate(self.val_dataloader):
-            x = x.to(self.gpu_id if self.gpu_id is not None else self.model.device)
-            y = y.to(self.gpu_id if self.gpu_id is not None else self.model.device)
+            # batches travel as int32 (half the PCIe bytes of int64) and
+            # are widened on device
+            x = x.to(self.gpu_id if self.gpu_id is not None else self.model.device, non_blocking=True).long()
+            y = y.to(self.gpu_id if self.gpu_id is not None else self.model.device, non_blocking=True).long()
             with self.ctx:
                 output, _ = self.model(x)
 
@@ -171,8 +180,9 @@ class BaseTrainer:
         for i in range(self.gradient_accumulation_steps):
             # get the next batch
             x, y = next(self.train_dataloader_iter)
-            x = x.to(self.gpu_id if self.gpu_id is not None else self.model.device)
-            y = y.to(self.gpu_id if self.gpu_id is not None else self.model.device)
+            # batches travel as int32 and are widened on device
+            x = x.to(self.gpu_id if self.gpu_id is not None else self.model.device, non_blocking=True).long()
+            y = y.to(self.gpu_id if self.gpu_id is not None else self.model.device, non_blocking=True).long()
 
             # Enable or disable gradient synchronization based on the need for accumulation
             if self.dist and hasattr(self.DDP_model, 'no_sync'):
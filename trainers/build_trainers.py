@@ -5,6 +5,7 @@ and the trainer itself.
 
 import os
 
+import numpy as np
 import torch
 from torch.distributed import init_process_group
 
@@ -132,6 +133,15 @@ def build_dataset(cfg, split):
     return DATASET_DICT[cfg.trainer["dataloader"]["name"]](cfg=cfg, split=split)
 
 
+def seed_dataloader_worker(worker_id):
+    """
+    Give every dataloader worker its own sampling stream, so workers
+    don't all replay the identical batch sequence of the forked parent.
+    """
+    worker_info = torch.utils.data.get_worker_info()
+    worker_info.dataset._rng = np.random.default_rng(worker_info.seed)
+
+
 
 LOSS_FN_DICT = {
     "cross_entropy": cross_entropy_loss_fn,
@@ -173,17 +183,38 @@ def build_trainer(cfg, model, gpu_id):
     val_dataset = build_dataset(cfg=cfg, split="val")
 
 
-    # wrap in dataloaders
+    # wrap in dataloaders; pinning the host batches lets the trainer's
+    # non_blocking H2D copies actually overlap with compute
+    pin_memory = torch.cuda.is_available()
+    # with workers, batch construction runs off the training process;
+    # keep the workers alive across epochs and let them run ahead
+    num_workers = cfg["trainer"]["dataloader"].get("num_workers", 0)
+    if cfg["trainer"]["dataloader"].get("gpu_resident", False):
+        # batches are built on the device; worker processes and host
+        # pinning don't apply to CUDA tensors
+        num_workers = 0
+        pin_memory = False
+    worker_kwargs = {}
+    if num_workers > 0:
+        worker_kwargs = {
+            "num_workers": num_workers,
+            "persistent_workers": True,
+            "prefetch_factor": 4,
+            "worker_init_fn": seed_dataloader_worker,
+        }
     train_dataloader = torch.utils.data.DataLoader(
         dataset=train_dataset,
         batch_size=cfg["trainer"]["training"]["batch_size"],
         shuffle=False,
-
+        pin_memory=pin_memory,
+        **worker_kwargs,
     )
     val_dataloader = torch.utils.data.DataLoader(
         dataset=val_dataset,
         batch_size=cfg["trainer"]["training"]["batch_size"],
         shuffle=False,
+        pin_memory=pin_memory,
+        **worker_kwargs,
     )
 
     # build loss function
@@ -2,16 +2,58 @@
 A collection of dataloaders
 """
 
+import json
 import os
 
 import numpy as np
 import torch
 from tqdm import tqdm
-import random
 
 from models.embedding_models import GenericEmbedder
 from trainers.utils import load_data
 
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, cache=True)
+    def _gather_cast(data, idxs, context_window, out):
+        """
+        Fused gather + widen: copy each sampled window out of the
+        (uint16 or int32) corpus directly into the preallocated int32
+        batch buffer in one parallel pass, with no intermediate
+        temporaries.
+        """
+        for b in prange(idxs.shape[0]):
+            base = idxs[b]
+            for t in range(context_window):
+                out[b, t] = data[base + t]
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # numba is optional; the iterators fall back to the numpy gather
+    NUMBA_AVAILABLE = False
+
+
+def load_meta(data_path):
+    """
+    Read the sidecar meta.json written next to a tokenized .bin at
+    preprocessing time, or None for legacy files without one.
+    """
+    meta_path = f"{data_path}.meta.json"
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+
+def _meta_dtype(data_path):
+    """
+    At-rest dtype of a tokenized .bin; legacy files without a sidecar
+    were written as uint16.
+    """
+    meta = load_meta(data_path)
+    return np.dtype(meta["dtype"]) if meta is not None else np.uint16
+
 
 
 class DatasetInterface(torch.utils.data.IterableDataset):
@@ -35,7 +77,16 @@ class DatasetInterface(torch.utils.data.IterableDataset):
         )
 
         self._load_data()
+        # optionally copy the corpus into RAM; for datasets that fit,
+        # this spares every batch gather the memmap page-fault path
+        if self.cfg["trainer"]["dataloader"].get("in_memory", False):
+            self._materialize()
         self.dataset_len = len(self.data) - self.context_window
+        # dedicated generator for index sampling; faster than the
+        # legacy global np.random functions and independent per dataset
+        self._rng = np.random.default_rng()
+        # window offsets reused by every batch gather
+        self._offsets = np.arange(self.context_window + 1, dtype=np.int64)
 
 
     def _load_data(self):
@@ -46,17 +97,39 @@ class DatasetInterface(torch.utils.data.IterableDataset):
             raise FileNotFoundError(f"{self.data_path} does not exist, preprocess the data first")
         self.data = np.memmap(
             self.data_path,
-            dtype=np.uint16,
+            dtype=_meta_dtype(self.data_path),
             mode="r",
         )
 
+    def _materialize(self):
+        """
+        Replace the memmap with a contiguous in-RAM copy
+        """
+        self.data = np.array(self.data, copy=True)
+
+    def __getstate__(self):
+        """
+        Drop memmap handles when pickling (e.g. to DataLoader worker
+        processes); each process re-opens its own in __setstate__
+        """
+        state = self.__dict__.copy()
+        for key in ("data", "data_byte"):
+            if isinstance(state.get(key), np.memmap):
+                state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.data is None:
+            self._load_data()
+
     def __len__(self):
         """
         Return dataset length
         """
         return self.dataset_len
     
-    def __iter__(self, idx):
+    def __iter__(self):
         raise NotImplementedError
     
     
@@ -66,22 +139,72 @@ class BaseDatasetRandom(DatasetInterface):
     """
     def __init__(self, split, cfg):
         super().__init__(split, cfg)
+        self.data_gpu = None
+        if (
+            self.cfg["trainer"]["dataloader"].get("gpu_resident", False)
+            and torch.cuda.is_available()
+        ):
+            # upload the corpus once; batches are then gathered on
+            # device and nothing but the index vector crosses PCIe
+            try:
+                self.data_gpu = torch.from_numpy(
+                    np.asarray(self.data, dtype=np.int32)
+                ).cuda()
+            except torch.cuda.OutOfMemoryError:
+                print(
+                    "gpu_resident requested but the corpus does not fit "
+                    "on the device, falling back to the memmap path"
+                )
+                self.data_gpu = None
+
+    def _iter_gpu_resident(self):
+        """
+        On-device batch construction from the GPU-resident corpus.
+        """
+        batch_size = self.cfg["trainer"]["training"]["batch_size"]
+        device = self.data_gpu.device
+        offsets = torch.arange(self.context_window + 1, device=device)
+        while True:
+            idxs = torch.randint(
+                self.dataset_len, (batch_size,), device=device
+            )
+            window = self.data_gpu[idxs[:, None] + offsets].long()
+            yield from zip(window[:, :-1], window[:, 1:])
 
-    
     def __iter__(self):
         """
         Get a batch of random data points in an infinite loop.
         """
+        if self.data_gpu is not None:
+            yield from self._iter_gpu_resident()
+        batch_size = self.cfg["trainer"]["training"]["batch_size"]
+        # x and y overlap in all but one position, so gather a single
+        # context_window + 1 wide window per sample and view both out
+        # of it, halving the bytes fetched
+        offsets = self._offsets
+        if NUMBA_AVAILABLE:
+            window_buf = np.empty(
+                (batch_size, self.context_window + 1), dtype=np.int32
+            )
         while True:
-            # Get a random index
-            idx = random.randint(0, self.dataset_len - 1)
-            
-            # Extract a slice of data for x and y
-            x = torch.from_numpy((self.data[idx: idx + self.context_window]).astype(np.int64))
-            y = torch.from_numpy((self.data[idx + 1: idx + 1 + self.context_window]).astype(np.int64))
-            
+            # Get a batch worth of random indices and gather all their
+            # windows from the memmap in one C-level fancy-index copy,
+            # instead of two small slices per sample
+            idxs = self._rng.integers(0, self.dataset_len, size=batch_size, dtype=np.int64)
+            if NUMBA_AVAILABLE:
+                # fused gather + cast into the reused batch buffer
+                _gather_cast(self.data, idxs, self.context_window + 1, window_buf)
+                window = torch.from_numpy(window_buf)
+            else:
+                gather = idxs[:, None] + offsets[None, :]
+                window = torch.from_numpy(
+                    self.data[gather].astype(np.int32, copy=False)
+                )
+            xs = window[:, :-1]
+            ys = window[:, 1:]
+
             # Yield the data points
-            yield x, y
+            yield from zip(xs, ys)
 
 
 class BytePoolingDataset(DatasetInterface):
@@ -90,25 +213,30 @@ class BytePoolingDataset(DatasetInterface):
     """
     def __init__(self, split, cfg):
         self.loading_shape = None
+        # the parent init dispatches to the _load_data override below
         super().__init__(split, cfg)
-        # force parent init
-        self._load_data()
 
     def _load_data(self):
         """
         Get data
         """
         if self.loading_shape is None:
-            data = np.memmap(
-                self.data_path,
-                dtype=np.uint16,
-                mode="r",
-            )
-            self.loading_shape = (len(data)// self.cfg["model"]["embedder"]["byte_context_window"], self.cfg["model"]["embedder"]["byte_context_window"])
-            data = None
+            meta = load_meta(self.data_path)
+            if meta is not None:
+                self.loading_shape = tuple(meta["shape"])
+            else:
+                # legacy file without a sidecar: probe the flat memmap
+                # once to infer the shape
+                data = np.memmap(
+                    self.data_path,
+                    dtype=np.uint16,
+                    mode="r",
+                )
+                self.loading_shape = (len(data)// self.cfg["model"]["embedder"]["byte_context_window"], self.cfg["model"]["embedder"]["byte_context_window"])
+                data = None
         self.data = np.memmap(
             self.data_path,
-            dtype=np.uint16,
+            dtype=_meta_dtype(self.data_path),
             mode="r",
             shape=self.loading_shape,
         )
@@ -117,11 +245,16 @@ class BytePoolingDataset(DatasetInterface):
         """
         Get a batch of data
         """
+        batch_size = self.cfg["trainer"]["training"]["batch_size"]
+        # fused context_window + 1 gather; x and y are views of it
+        offsets = self._offsets
         while True:
-            idx = random.randint(0, self.dataset_len - 1)
-            x = torch.from_numpy((self.data[idx: idx + self.context_window]).astype(np.int64))
-            y = torch.from_numpy((self.data[idx + 1: idx + 1 + self.context_window]).astype(np.int64))
-            yield x, y
+            idxs = self._rng.integers(0, self.dataset_len, size=batch_size, dtype=np.int64)
+            gather = idxs[:, None] + offsets[None, :]
+            window = torch.from_numpy(self.data[gather].astype(np.int32, copy=False))
+            xs = window[:, :-1]
+            ys = window[:, 1:]
+            yield from zip(xs, ys)
     
 
 class DualBytePooling(DatasetInterface):
@@ -138,47 +271,61 @@ class DualBytePooling(DatasetInterface):
         )
         self.data_path_byte = os.path.join(data_folder, f"{split}_byte.bin")
         self.data_path_token = os.path.join(data_folder, f"{split}_token.bin")
+        # the parent init dispatches to the _load_data override below
         super().__init__(split, cfg)
 
-        # force parent init
-        self._load_data()
-
     def _load_data(self):
         """
         Get both the byte-level and the token level data
         """
         if self.loading_shape is None:
-            data = np.memmap(
-                self.data_path_byte,
-                dtype=np.uint16,
-                mode="r",
-            )
-            self.loading_shape = (len(data)// self.cfg["model"]["embedder"]["byte_context_window"], self.cfg["model"]["embedder"]["byte_context_window"])
-            data = None
+            meta = load_meta(self.data_path_byte)
+            if meta is not None:
+                self.loading_shape = tuple(meta["shape"])
+            else:
+                # legacy file without a sidecar: probe the flat memmap
+                # once to infer the shape
+                data = np.memmap(
+                    self.data_path_byte,
+                    dtype=np.uint16,
+                    mode="r",
+                )
+                self.loading_shape = (len(data)// self.cfg["model"]["embedder"]["byte_context_window"], self.cfg["model"]["embedder"]["byte_context_window"])
+                data = None
         self.data_byte = np.memmap(
             self.data_path_byte,
-            dtype=np.uint16,
+            dtype=_meta_dtype(self.data_path_byte),
             mode="r",
             shape=self.loading_shape,
         )
         self.data = np.memmap(
             self.data_path_token,
-            dtype=np.uint16,
+            dtype=_meta_dtype(self.data_path_token),
             mode="r",
         )
-    
+
+    def _materialize(self):
+        """
+        Replace both memmaps with contiguous in-RAM copies
+        """
+        super()._materialize()
+        self.data_byte = np.array(self.data_byte, copy=True)
+
     def __iter__(self):
         """
         Get a batch of data from both the byte and higher token level
         """
+        batch_size = self.cfg["trainer"]["training"]["batch_size"]
+        # x and y come from different arrays here, so only a
+        # context_window wide slice of the shared offsets is needed
+        offsets = self._offsets[: self.context_window]
         while True:
-            idx = random.randint(0, self.dataset_len - 1)
+            idxs = self._rng.integers(0, self.dataset_len, size=batch_size, dtype=np.int64)
+            gather = idxs[:, None] + offsets[None, :]
             # get byte level batch
-            x_byte = torch.from_numpy((self.data_byte[idx: idx + self.context_window]).astype(np.int64))
-            #y_byte = torch.from_numpy((self.data_byte[idx + 1: idx + 1 + self.context_window]).astype(np.int64))
+            xs_byte = torch.from_numpy(self.data_byte[gather].astype(np.int32, copy=False))
 
             # get token level batch
-            #x_token = torch.from_numpy((self.data_token[idx: idx + self.context_window]).astype(np.int64))
-            y_token = torch.from_numpy((self.data[idx + 1: idx + 1 + self.context_window]).astype(np.int64))
-            yield x_byte, y_token  
+            ys_token = torch.from_numpy(self.data[gather + 1].astype(np.int32, copy=False))
+            yield from zip(xs_byte, ys_token)
 
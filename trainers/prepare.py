@@ -1,13 +1,25 @@
 """
 Necessary to be run before training to make sure all of the data is preprcessed etc.
 """
-import os 
-import torch 
-import numpy as np 
-from tqdm import tqdm 
+import json
+import os
+import shutil
+import torch
+import numpy as np
+from tqdm import tqdm
 from trainers.utils import load_data
 
-from models.build_models import build_embedding_model 
+from models.build_models import build_embedding_model
+
+
+def write_meta(filename, arr):
+    """
+    Write a sidecar meta.json next to a tokenized .bin file, so the
+    datasets can memmap it directly with the right shape instead of
+    probing the file first
+    """
+    with open(f"{filename}.meta.json", "w") as f:
+        json.dump({"shape": list(arr.shape), "dtype": str(arr.dtype)}, f)
 
 
 class StandardProcessor:
@@ -17,10 +29,14 @@ class StandardProcessor:
     def __init__(self, embedder):
         self.embedder = embedder
 
-    def process(self, example):
-        ids = self.embedder.tokenize_input(example["text"])
-        return {"ids": ids, "len": len(ids)}
-    
+    def process(self, batch):
+        """
+        Tokenize a batch of examples (used with dataset.map(batched=True)
+        so the tokenizer is called once per batch, not per example)
+        """
+        ids_list = self.embedder.tokenize_input_batch(batch["text"])
+        return {"ids": ids_list, "len": [len(ids) for ids in ids_list]}
+
     def write_tokenized_data(self, tokenized, tokenized_data_folder):
         """
         Write the tokenized data to a file
@@ -28,27 +44,29 @@ class StandardProcessor:
         for split, dset in tokenized.items():
             arr_len = np.sum(dset["len"], dtype=np.uint64)
             filename = os.path.join(tokenized_data_folder, f"{split}.bin")
-            dtype = np.uint16  # (can do since enc.max_token_value == 50256 is < 2**16)
+            dtype = np.int32  # int32 at rest: torch.from_numpy is then zero-copy at read time
             arr = np.memmap(
-                filename, 
-                dtype=dtype, 
-                mode="w+", 
+                filename,
+                dtype=dtype,
+                mode="w+",
                 shape=(arr_len,)
             )
-            total_batches = 1024
 
             idx = 0
-            for batch_idx in tqdm(range(total_batches), desc=f"writing {filename}"):
-                # Batch together samples for faster write
-                batch = dset.shard(
-                    num_shards=total_batches, index=batch_idx, contiguous=True
-                ).with_format("numpy")
+            # stream large contiguous chunks straight into the memmap -
+            # far fewer Python iterations and bigger sequential writes
+            # than the old 1024-shard loop
+            for batch in tqdm(
+                dset.with_format("numpy").iter(batch_size=65536),
+                desc=f"writing {filename}",
+            ):
                 arr_batch = np.concatenate(batch["ids"])
                 # Write into mmap
                 arr[idx : idx + len(arr_batch)] = arr_batch
                 idx += len(arr_batch)
             arr.flush()
-    
+            write_meta(filename, arr)
+
 class ByteLevelProcessor(StandardProcessor):
     """
     A byte-level processor that tokenizes the text
@@ -60,26 +78,26 @@ class ByteLevelProcessor(StandardProcessor):
         for split, dset in tokenized.items():
             arr_len = np.sum(dset["len"], dtype=np.uint64)
             filename = os.path.join(tokenized_data_folder, f"{split}.bin")
-            dtype = np.uint16  # (can do since enc.max_token_value == 50256 is < 2**16)
+            dtype = np.int32  # int32 at rest: torch.from_numpy is then zero-copy at read time
             arr = np.memmap(
                 filename,
                 dtype=dtype,
                 mode="w+",
                 shape=(arr_len, 12), #TODO remove hardcoding
             )
-            total_batches = 1024
 
             idx = 0
-            for batch_idx in tqdm(range(total_batches), desc=f"writing {filename}"):
-                # Batch together samples for faster write
-                batch = dset.shard(
-                    num_shards=total_batches, index=batch_idx, contiguous=True
-                ).with_format("numpy")
+            # stream large contiguous chunks straight into the memmap
+            for batch in tqdm(
+                dset.with_format("numpy").iter(batch_size=65536),
+                desc=f"writing {filename}",
+            ):
                 arr_batch = np.concatenate(batch["ids"])
                 # Write into mmap
                 arr[idx : idx + len(arr_batch)] = arr_batch
                 idx += len(arr_batch)
             arr.flush()
+            write_meta(filename, arr)
 
 class DualByteLevelProcessor(StandardProcessor):
     """
@@ -90,10 +108,22 @@ class DualByteLevelProcessor(StandardProcessor):
     def __init__(self, embedder):
         super().__init__(embedder)
 
-    def process(self, example):
-        byte_ids, token_ids = self.embedder.tokenize_input(example["text"], return_high_level=True)
-        return {"byte_ids": byte_ids, "token_ids": token_ids, "len": len(token_ids)}
-    
+    def process(self, batch):
+        """
+        Tokenize a batch of examples; the dual byte/token tokenization
+        has no batched tokenizer call, so loop within the batch
+        """
+        byte_ids_list, token_ids_list = [], []
+        for text in batch["text"]:
+            byte_ids, token_ids = self.embedder.tokenize_input(text, return_high_level=True)
+            byte_ids_list.append(byte_ids)
+            token_ids_list.append(token_ids)
+        return {
+            "byte_ids": byte_ids_list,
+            "token_ids": token_ids_list,
+            "len": [len(token_ids) for token_ids in token_ids_list],
+        }
+
     def write_tokenized_data(self, tokenized, tokenized_data_folder):
         for split, dset in tokenized.items():
             arr_len = np.sum(dset["len"], dtype=np.uint64)
@@ -101,7 +131,7 @@ class DualByteLevelProcessor(StandardProcessor):
             filename_byte = os.path.join(tokenized_data_folder, f"{split}_byte.bin")
             filename_token = os.path.join(tokenized_data_folder, f"{split}_token.bin")
 
-            dtype = np.uint16  # (can do since enc.max_token_value == 50256 is < 2**16)
+            dtype = np.int32  # int32 at rest: torch.from_numpy is then zero-copy at read time
 
             arr_byte = np.memmap(
                 filename_byte,
@@ -117,14 +147,12 @@ class DualByteLevelProcessor(StandardProcessor):
                 shape=(arr_len,),
             )
 
-            total_batches = 1024
-
             idx = 0
-            for batch_idx in tqdm(range(total_batches), desc=f"writing {filename_byte} and {filename_token}"):
-                # Batch together samples for faster write
-                batch = dset.shard(
-                    num_shards=total_batches, index=batch_idx, contiguous=True
-                ).with_format("numpy")
+            # stream large contiguous chunks straight into the memmaps
+            for batch in tqdm(
+                dset.with_format("numpy").iter(batch_size=65536),
+                desc=f"writing {filename_byte} and {filename_token}",
+            ):
                 arr_batch_byte = np.concatenate(batch["byte_ids"])
                 arr_batch_token = np.concatenate(batch["token_ids"])
 
@@ -135,6 +163,8 @@ class DualByteLevelProcessor(StandardProcessor):
 
             arr_byte.flush()
             arr_token.flush()
+            write_meta(filename_byte, arr_byte)
+            write_meta(filename_token, arr_token)
 
 
 
@@ -167,10 +197,13 @@ def prepare_data(cfg):
     if os.path.exists(tokenized_data_folder) and len(os.listdir(tokenized_data_folder))!=0:
         print("Tokenized data already exists")
         return
-    else:
-        # create the folder if it doesn't exist   
-        if not os.path.exists(tokenized_data_folder):
-            os.makedirs(tokenized_data_folder)
+
+    # write into a temporary folder and rename on success, so a crash
+    # mid-write can't leave half-written files that the guard above
+    # would mistake for finished data
+    tmp_folder = f"{tokenized_data_folder}.tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
 
 
     # load embedder
@@ -188,29 +221,36 @@ def prepare_data(cfg):
     # wrap in try such that half-complete files can be deleted on error
     try:
         # Get the maximum number of processors
-        max_procs = os.cpu_count()
-        # cap at 12 to reduce memory usage
-        max_procs = 1 #min(max_procs, 12) # TODO properly fix this
+        # (leave one core for the main process, cap at 12 to
+        # reduce memory usage)
+        max_procs = min(max(os.cpu_count() - 1, 1), 12)
         print(f"Using {max_procs} processors")
 
-        # tokenize the dataset
+        # tokenize the dataset in parallel, with batched tokenizer
+        # calls within each worker
         tokenized = split_dataset.map(
             processor_object.process,
             remove_columns=["text"],
             desc="Tokenizing dataset",
+            batched=True,
+            batch_size=1000,
             num_proc=max_procs
         )
 
         # concatenate all the ids in each dataset
         processor_object.write_tokenized_data(
-            tokenized=tokenized, 
-            tokenized_data_folder=tokenized_data_folder
+            tokenized=tokenized,
+            tokenized_data_folder=tmp_folder
         )
 
+        # everything was written - move the folder into place
+        if os.path.exists(tokenized_data_folder):
+            os.rmdir(tokenized_data_folder)
+        os.rename(tmp_folder, tokenized_data_folder)
+
     except Exception as exc:
         print(f"Error: {exc}")
-        for file in os.listdir(tokenized_data_folder):
-            os.remove(os.path.join(tokenized_data_folder, file))
+        shutil.rmtree(tmp_folder, ignore_errors=True)
         raise RuntimeError("Failed to process and write data") from exc
 
 
@@ -244,6 +244,42 @@ def profilize(model, classes=None):
 
         model.forward = forward_wrapper
 
+class CUDAPrefetcher:
+    """
+    Wraps a (x, y) batch iterator and copies the next batch to the GPU
+    on a side CUDA stream while the model is still busy with the
+    current batch, hiding the H2D transfer time of each step.
+    """
+
+    def __init__(self, loader_iter, device):
+        self.loader_iter = loader_iter
+        self.device = device
+        self.copy_stream = torch.cuda.Stream(device=device)
+        self._preload()
+
+    def _preload(self):
+        """Start copying the next batch on the side stream."""
+        x, y = next(self.loader_iter)
+        with torch.cuda.stream(self.copy_stream):
+            self.next_x = x.to(self.device, non_blocking=True)
+            self.next_y = y.to(self.device, non_blocking=True)
+        self.copy_event = torch.cuda.Event()
+        self.copy_event.record(self.copy_stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # make the compute stream wait for the pending copy, hand the
+        # batch over, and immediately start prefetching the next one
+        torch.cuda.current_stream().wait_event(self.copy_event)
+        x, y = self.next_x, self.next_y
+        x.record_stream(torch.cuda.current_stream())
+        y.record_stream(torch.cuda.current_stream())
+        self._preload()
+        return x, y
+
+
 def is_dist():
     """
     Check if the current process is distributed.